@@ -1,7 +1,12 @@
 import os
-import json
+import duckdb
+import numpy as np
+import orjson
 import pandas as pd
 import geopandas as gpd
+import pyarrow as pa
+from pyarrow import csv as pacsv
+import shapely
 from shapely.wkt import loads
 
 
@@ -28,6 +33,7 @@ class TeliaDataProcessor:
         self.way_mapping = None
         self.telia_summary = None
         self.combined_df = None
+        self.people_range = None
 
     def load_telia_data(self):
         """Laster alle CSV-filer i de oppgitte mappene og kombinerer dem til én DataFrame per type."""
@@ -41,13 +47,17 @@ class TeliaDataProcessor:
             if not csv_files:
                 raise FileNotFoundError(f"Ingen CSV-filer funnet i {folder}")
             
-            df_list = []
-            for file in csv_files:
-                file_path = os.path.join(folder, file)
-                df = pd.read_csv(file_path, sep=";")  # Juster separator hvis nødvendig
-                df_list.append(df)
-
-            return pd.concat(df_list, ignore_index=True)
+            # pyarrow leser CSV flertrådet og er 5-10x raskere enn pandas på
+            # store dumper; tabellene slås sammen én gang og går zero-copy
+            # over til pandas
+            tables = [
+                pacsv.read_csv(
+                    os.path.join(folder, file),
+                    parse_options=pacsv.ParseOptions(delimiter=";"),  # Juster separator hvis nødvendig
+                )
+                for file in csv_files
+            ]
+            return pa.concat_tables(tables).to_pandas()
 
         # Laste daglige data
         self.daily_data = load_csvs_from_folder(self.daily_folder)
@@ -72,25 +82,47 @@ class TeliaDataProcessor:
         print(f"📌 Bruker '{way_id_column}' som way_id.")
         return self.way_mapping
 
-    def aggregate_telia_data(self):
-        """Organizes Telia-data per way_id and hour."""
+    def merge_data(self):
+        """Aggregerer Telia-data per way_id og time og slår dem sammen med vei-geometri."""
         if self.hourly_data is None:
             raise Exception("🚨 Kjør først load_telia_data() for å laste inn CSV-filene.")
-
-        self.telia_summary = (
-            self.hourly_data.groupby(["way_id", "hour"])["people"]
-            .mean()
-            .reset_index()
-        )
-        return self.telia_summary
-
-    def merge_data(self):
-        """Slår sammen Telia-data med vei-geometri basert på way_id."""
-        if self.telia_summary is None:
-            raise Exception("🚨 Kjør aggregate_telia_data() før sammenslåing.")
         if self.way_mapping is None:
             self.load_shapefile()
 
+        # DuckDB gjør groupby og min/max-skanningen i én vektorisert spørring
+        # direkte mot pandas-framen (zero-copy via Arrow) i stedet for tre
+        # separate pandas-pass over de samme radene
+        con = duckdb.connect()
+        con.register("hourly", self.hourly_data)
+        con.register("ways", self.way_mapping[["way_id"]])
+        self.telia_summary = con.execute(
+            """
+            SELECT way_id, hour, people,
+                   MIN(people) OVER () AS min_people,
+                   MAX(people) OVER () AS max_people
+            FROM (
+                SELECT way_id, CAST(hour AS TINYINT) AS hour, AVG(people) AS people
+                FROM hourly
+                -- Kun veier som finnes i shapefilen teller med i min/max,
+                -- slik at normaliseringen matcher det som faktisk tegnes
+                WHERE way_id IN (SELECT way_id FROM ways)
+                GROUP BY way_id, hour
+            )
+            """
+        ).fetch_df()
+        con.close()
+
+        if len(self.telia_summary) > 0:
+            self.people_range = (
+                self.telia_summary["min_people"].iloc[0],
+                self.telia_summary["max_people"].iloc[0],
+            )
+        else:
+            self.people_range = (0, 0)
+        self.telia_summary = self.telia_summary[["way_id", "hour", "people"]]
+
+        # Geometrijoinen beholdes i pandas siden DuckDB ikke kan lese
+        # shapely-geometrikolonnen; den er liten (én rad per vei)
         self.combined_df = pd.merge(self.way_mapping, self.telia_summary, on="way_id", how="left")
         print("🔗 Data slått sammen:")
         print(self.combined_df.head())
@@ -101,17 +133,42 @@ class TeliaDataProcessor:
         if self.combined_df is None:
             raise Exception("🚨 Kjør merge_data() før kartgenerering.")
 
-        min_val = self.combined_df["people"].min()
-        max_val = self.combined_df["people"].max()
+        min_val, max_val = self.people_range
 
-        def generate_color(val):
-            """Genererer en farge fra grønn til rød basert på trafikkmengde."""
-            norm_value = (val - min_val) / (max_val - min_val) if max_val > min_val else 0
-            r = int(norm_value * 255)
-            g = int((1 - norm_value) * 255)
-            return f"rgb({r},{g},0)"
+        # Pivoter til én rad per vei med et 24-timers array i stedet for én rad
+        # (og én serialisert geometri) per vei og time — HTML-filen krymper
+        # opptil 24x og slideren slipper å bygge laget på nytt
+        valid = self.combined_df[
+            self.combined_df["geometry"].notna() & self.combined_df["people"].notna()
+        ]
+
+        hours_people = (
+            valid.pivot_table(index="way_id", columns="hour", values="people", aggfunc="mean", observed=True)
+            .reindex(columns=range(24))
+        )
+        geometries = (
+            valid.drop_duplicates("way_id")
+            .set_index("way_id")["geometry"]
+            .reindex(hours_people.index)
+        )
 
-        html_content = """
+        # Hele fargematrisen (veier x 24 timer) beregnes som ett numpy-uttrykk
+        # i stedet for en int-cast og f-string per verdi; nettleseren slår bare
+        # opp ferdig farge. Timer uten data blir None.
+        people_matrix = hours_people.to_numpy()
+        missing = np.isnan(people_matrix)
+        if max_val > min_val:
+            norm = (np.nan_to_num(people_matrix, nan=min_val) - min_val) / (max_val - min_val)
+        else:
+            norm = np.zeros_like(people_matrix)
+        red = np.rint(norm * 255).astype(np.uint8)
+        green = np.rint((1 - norm) * 255).astype(np.uint8)
+        colors = np.char.add(np.char.mod("rgb(%d,", red), np.char.mod("%d,0)", green))
+        hours_colors = np.where(missing, None, colors).tolist()
+
+        # Samler HTML-fragmenter i en liste og joiner én gang til slutt;
+        # strengkonkatenering med += blir kvadratisk over tusenvis av polylines
+        html_parts = ["""
         <!DOCTYPE html>
         <html>
         <head>
@@ -127,43 +184,61 @@ class TeliaDataProcessor:
                 var map = L.map('map').setView([63.4305, 10.3951], 12);
                 L.tileLayer('https://{s}.tile.openstreetmap.org/{z}/{x}/{y}.png').addTo(map);
 
-                var layers = {};
-        """
-
-        for hour in range(24):
-            html_content += f"layers[{hour}] = L.layerGroup([]);\n"
-
-        for _, row in self.combined_df.iterrows():
-            if pd.notna(row["geometry"]) and pd.notna(row["people"]):
-                shape = row["geometry"]
-                coordinates = [[y, x] for x, y in shape.coords]
-                color = generate_color(row["people"])
-                hour = int(row["hour"])
-                html_content += f"""
-                    L.polyline({json.dumps(coordinates)}, {{ color: '{color}', weight: 3, opacity: 1.0 }}).addTo(layers[{hour}]);
-                """
+        """]
+
+        # Én GeoJSON FeatureCollection med hele 24-timers-profilen i properties;
+        # nettleseren parser blobben med sin native JSON-parser og slideren
+        # restyler eksisterende features i stedet for å bygge nye lag
+        coords, coord_index = shapely.get_coordinates(geometries.values, return_index=True)
+        per_line = np.split(coords, np.unique(coord_index, return_index=True)[1][1:])
+
+        features = [
+            {
+                "type": "Feature",
+                "geometry": {"type": "LineString", "coordinates": line_coords},
+                "properties": {"hours_colors": color_row},
+            }
+            for line_coords, color_row in zip(per_line, hours_colors)
+        ]
+
+        geojson = orjson.dumps(
+            {"type": "FeatureCollection", "features": features},
+            option=orjson.OPT_SERIALIZE_NUMPY,
+        ).decode()
+        html_parts.append(f"var roads = {geojson};\n")
+
+        html_parts.append("""
+                var currentHour = 0;
+
+                function styleFor(feature, hour) {
+                    var color = feature.properties.hours_colors[hour];
+                    if (color === null) {
+                        return { opacity: 0 };
+                    }
+                    return { color: color, weight: 3, opacity: 1.0 };
+                }
 
-        html_content += """
-                map.addLayer(layers[0]);
+                var layer = L.geoJSON(roads, {
+                    style: function (feature) {
+                        return styleFor(feature, currentHour);
+                    }
+                }).addTo(map);
 
                 document.getElementById('hour-slider').addEventListener('input', function(e) {
-                    var selectedHour = e.target.value;
-                    document.getElementById('current-hour').innerText = selectedHour;
+                    currentHour = parseInt(e.target.value);
+                    document.getElementById('current-hour').innerText = currentHour;
 
-                    for (var h = 0; h < 24; h++) {
-                        if (map.hasLayer(layers[h])) {
-                            map.removeLayer(layers[h]);
-                        }
-                    }
-                    map.addLayer(layers[selectedHour]);
+                    layer.eachLayer(function (l) {
+                        l.setStyle(styleFor(l.feature, currentHour));
+                    });
                 });
             </script>
         </body>
         </html>
-        """
+        """)
 
         with open(self.output_html, "w") as file:
-            file.write(html_content)
+            file.write("".join(html_parts))
 
         print(f"✅ Generert kart med time-slider i {self.output_html}")
 
@@ -172,7 +247,6 @@ class TeliaDataProcessor:
 if __name__ == "__main__":
     processor = TeliaDataProcessor()
     processor.load_telia_data()
-    processor.aggregate_telia_data()
     processor.load_shapefile()
     processor.merge_data()
     processor.generate_map()
\ No newline at end of file